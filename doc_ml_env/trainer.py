@@ -2,10 +2,56 @@ import torch
 from torch import nn
 import torch.optim as optim
 from torch.amp import autocast, GradScaler
-from sklearn.metrics import accuracy_score
+from torch.utils.data import DataLoader, TensorDataset
 from tqdm import tqdm
 import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
 from glob import glob
+import matplotlib.pyplot as plt
+
+
+class CUDAPrefetcher:
+    """批次预取器：在侧 CUDA 流上发起下一个批次的 H2D 拷贝，与当前步的前向/反向真正重叠"""
+    def __init__(self, dataloader, device):
+        self.dataloader = dataloader
+        self.device = device
+        self.stream = torch.cuda.Stream()  # 专用拷贝流，与计算所在的主流互不阻塞
+
+    def __len__(self):
+        return len(self.dataloader)
+
+    def __iter__(self):
+        self._iter = iter(self.dataloader)
+        self._preload()
+        return self
+
+    def _preload(self):
+        """在侧流上异步拷贝下一个批次"""
+        try:
+            batch = next(self._iter)
+        except StopIteration:
+            self._next_batch = None
+            return
+        with torch.cuda.stream(self.stream):
+            self._next_batch = {
+                k: v.to(self.device, non_blocking=True) if torch.is_tensor(v) else v
+                for k, v in batch.items()
+            }
+
+    def __next__(self):
+        if self._next_batch is None:
+            raise StopIteration
+        # 主流等待侧流上的拷贝完成，之后立刻预取再下一个批次
+        torch.cuda.current_stream().wait_stream(self.stream)
+        batch = self._next_batch
+        for v in batch.values():
+            if torch.is_tensor(v):
+                # 张量分配在侧流上、消费在主流上：登记主流后，引用释放时分配器
+                # 会等主流读完才复用这块显存，避免被后续预取的拷贝覆盖
+                v.record_stream(torch.cuda.current_stream())
+        self._preload()
+        return batch
 
 
 class Trainer:
@@ -20,6 +66,8 @@ class Trainer:
         scheduler=optim.lr_scheduler.ReduceLROnPlateau,  # 学习率调度器：验证集上的性能指标停止提升时，减小学习率来帮助模型跳出局部最优，继续优化
         batch_size=512,  # 样本批量
         model_path='./model/checkpoint/',  # 模型检查点保存路径
+        preload_to_gpu=False,  # 是否将整个数据集一次性载入显存（要求数据集能放进 VRAM）
+        use_cuda_graph=False,  # 是否把训练步捕获为 CUDA Graph（要求各批次填充到固定长度）
     ):
         self.batch_size = batch_size
         self.model_path = model_path
@@ -28,82 +76,337 @@ class Trainer:
         if torch.cuda.is_available():
             self.device = torch.device("cuda")  # 如果有可用的 GPU，则使用 GPU
             print(f"使用 GPU: {torch.cuda.get_device_name(0)}")
+
+            # 固定形状输入下让 cuDNN 自动选择最快算法；并放开 TF32，
+            # 使 autocast 之外的 fp32 矩阵乘（如 CRF 转移矩阵）也能走张量核心
+            torch.backends.cudnn.benchmark = True
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+            torch.set_float32_matmul_precision('high')
         else:
             self.device = torch.device("cpu")  # 如果没有可用的 GPU，则使用 CPU
             print("使用 CPU")
         
         self.model = model.to(self.device)
+
+        # 含二维卷积的骨干转为 channels_last：同一 warp 的线程连续读取相邻通道，
+        # 访存可合并；纯 Linear 骨干没有收益，保持默认布局
+        if any(isinstance(m, nn.Conv2d) for m in self.model.modules()):
+            self.model = self.model.to(memory_format=torch.channels_last)
+
+        # 验证/推理路径尝试 TorchScript：算子融合并绕开 Python 逐算子分发；
+        # 训练仍走即时模式的 self.model，autograd 图构建不受影响
+        try:
+            self._scripted_model = torch.jit.script(self.model)
+            if not hasattr(self._scripted_model, 'decode'):
+                self._scripted_model = self.model  # decode 未被脚本化时整体退回即时模式
+        except Exception as e:
+            print(f'TorchScript 脚本化失败，验证使用即时模式: {e}')
+            self._scripted_model = self.model
+
+        # 训练路径交给 torch.compile：TorchInductor 把逐点算子链（GeLU/LayerNorm/softmax）
+        # 融合成少量大核，减少中间结果的显存往返；CRF 的损失与解码留在编译图之外。
+        # 保留即时模式引用：CUDA Graph 手动捕获不能穿过编译包装（其内部自带图机制）
+        self._eager_model = self.model
+        if hasattr(torch, 'compile') and self.device.type == 'cuda':
+            self.model = torch.compile(self.model, mode='reduce-overhead', fullgraph=False)
+
+        self.preload_to_gpu = preload_to_gpu and self.device.type == 'cuda'
+        if self.preload_to_gpu:
+            # 数据集整体常驻显存，逐步 H2D 拷贝被彻底消除，加载器只派发下标
+            self.train_ids_gpu, self.train_mask_gpu, self.train_labels_gpu = self._preload(train_dataloader.dataset)
+            self.dev_ids_gpu, self.dev_mask_gpu, self.dev_labels_gpu = self._preload(dev_dataloader.dataset)
+            self.train_dataloader = self._index_dataloader(self.train_ids_gpu.size(0), shuffle=True)
+            self.dev_dataloader = self._index_dataloader(self.dev_ids_gpu.size(0), shuffle=False)
+        else:
+            # 重建加载器以启用锁页内存，配合 non_blocking 拷贝重叠 PCIe 传输与计算
+            self.train_dataloader = self._wrap_dataloader(train_dataloader)
+            self.dev_dataloader = self._wrap_dataloader(dev_dataloader)
         
-        self.train_dataloader = train_dataloader
-        self.dev_dataloader = dev_dataloader
-        
-        self.optimizer = optimizer
-        self.scheduler = scheduler
-        
-        self.scaler = scaler
-        
-    def train_model():
-        """在训练集上个更新模型权重"""
+        # Ampere 及以上优先用 bf16：指数位与 fp32 相同不会下溢，无需梯度缩放器
+        if self.device.type == 'cuda' and torch.cuda.is_bf16_supported():
+            self._amp_dtype = torch.bfloat16
+            self.scaler = None  # 省去 scale/unscale 核函数与 inf/nan 重试
+        else:
+            self._amp_dtype = torch.float16
+            self.scaler = scaler
+
+        # CUDA Graph 回放消除每步的核函数启动开销；GradScaler 的 CPU 侧 inf 检查无法被捕获，
+        # 因此仅在 bf16（无缩放器）路径上生效
+        self.use_cuda_graph = use_cuda_graph and self.device.type == 'cuda' and self.scaler is None
+        self._cuda_graph = None
+        self._graph_warmup = 0
+
+        # 默认传入的是优化器类而非实例，这里统一实例化；
+        # fused=True 把逐参数张量的小核函数合并为单个 multi-tensor 核，一遍扫完参数显存；
+        # 图捕获期间 Optimizer.step() 要求 capturable=True，否则在捕获流上直接抛错
+        extra = {'capturable': True} if self.use_cuda_graph else {}
+        if isinstance(optimizer, type):
+            try:
+                self.optimizer = optimizer(self.model.parameters(), fused=torch.cuda.is_available(), **extra)
+            except (TypeError, RuntimeError):
+                # 不支持 fused 核时退回 foreach 多张量实现
+                self.optimizer = optimizer(self.model.parameters(), foreach=True, **extra)
+        else:
+            self.optimizer = optimizer
+
+        # 调度器同理：传类则绑定到优化器上实例化
+        self.scheduler = scheduler(self.optimizer) if isinstance(scheduler, type) else scheduler
+
+        # 检查点在后台线程落盘，序列化大权重不再阻塞训练主线程（进程退出时自动 join）
+        self._save_executor = ThreadPoolExecutor(max_workers=1)
+        self._save_future = None
+
+    def _preload(self, dataset):
+        """把数据集的三个字段堆叠成连续的 CUDA 张量，训练时在显存内按下标取批"""
+        input_ids = torch.stack([sample['input_ids'] for sample in dataset]).to(self.device).contiguous()
+        if input_ids.dtype == torch.int64:
+            input_ids = input_ids.to(torch.int32)  # 常驻显存的词 id 用 int32，占用与取批带宽减半
+        attention_mask = torch.stack([sample['attention_mask'] for sample in dataset]).to(self.device).contiguous()
+        labels = torch.stack([sample['labels'] for sample in dataset]).to(self.device).contiguous()
+        return input_ids, attention_mask, labels
+
+    def _index_dataloader(self, n, shuffle):
+        """只派发样本下标的轻量加载器：显存内取批是常数时间的指针运算，无需 worker 与锁页内存"""
+        return DataLoader(
+            TensorDataset(torch.arange(n)),
+            batch_size=self.batch_size,
+            shuffle=shuffle,
+            pin_memory=False,
+            num_workers=0,
+        )
+
+    def _wrap_dataloader(self, dataloader):
+        """重建数据加载器，开启锁页内存与常驻 worker，加快主机到显存的拷贝"""
+        # CPU 训练或已开启锁页内存时不需要重建；调用方用了自定义 batch_sampler 时
+        # （此时 batch_size 为 None）无法安全复刻原有组批方式，原样返回
+        if self.device.type != 'cuda' or dataloader.pin_memory or dataloader.batch_size is None:
+            return dataloader
+
+        return DataLoader(
+            dataloader.dataset,
+            batch_size=dataloader.batch_size,
+            sampler=dataloader.sampler,  # 沿用原有的采样顺序
+            num_workers=max(dataloader.num_workers, 2),
+            collate_fn=dataloader.collate_fn,
+            pin_memory=True,  # 锁页内存：DMA 直接拷贝，免去可分页内存的中转
+            drop_last=dataloader.drop_last,
+            worker_init_fn=dataloader.worker_init_fn,  # 保留调用方的 worker 种子设置
+            generator=dataloader.generator,
+            persistent_workers=True,  # worker 进程跨 epoch 复用，省去反复启动的开销
+        )
+
+    def train_model(self):
+        """在训练集上更新模型权重，返回整轮累加的损失（0 维 GPU 张量）"""
         # TODO: 需要根据不同模型重新定义
-        for batch in tqdm(self.train_dataloader, desc="模型训练"):
-            input_ids = batch['input_ids'].to(self.device)
-            attention_mask = batch['attention_mask'].to(self.device)
-            labels = batch['labels'].to(self.device)
-
-            self.optimizer.zero_grad()  # 将梯度置零放在循环开始处，以避免潜在的优化问题
-
-            # 自动管理混合精度的上下文
-            with autocast(device_type=self.device.type):
-                logits = self.model(input_ids, attention_mask=attention_mask)
-                
-                # 在训练函数中计算损失
-                log_likelihood = self.model.crf(logits, labels, mask=attention_mask.byte(), reduction='mean')
-                loss = -log_likelihood
-
-            # 使用梯度缩放进行反向传播
+        train_loss = torch.zeros((), device=self.device)  # 整轮损失留在显存累加
+        dataloader = self.train_dataloader
+        if self.device.type == 'cuda' and not self.preload_to_gpu:
+            dataloader = CUDAPrefetcher(dataloader, self.device)  # 下个批次的拷贝与本步计算重叠
+        for batch in tqdm(dataloader, desc="模型训练"):
+            if self.preload_to_gpu:
+                # 数据已常驻显存，按下标取批即可，无任何 PCIe 传输
+                idx = batch[0].to(self.device, non_blocking=True)
+                input_ids = self.train_ids_gpu[idx]
+                attention_mask = self.train_mask_gpu[idx]
+                labels = self.train_labels_gpu[idx]
+            else:
+                # non_blocking 配合锁页内存，拷贝与 GPU 计算异步重叠
+                input_ids = batch['input_ids'].to(self.device, non_blocking=True)
+                attention_mask = batch['attention_mask'].to(self.device, non_blocking=True)
+                labels = batch['labels'].to(self.device, non_blocking=True)
+
+            if input_ids.dtype == torch.int64:
+                # 词表远小于 2^31：int32 索引把嵌入查表的访存字节数减半（labels 因 CRF 的
+                # gather 需要 long 索引而保持 int64）
+                input_ids = input_ids.to(torch.int32)
+
+            if self.use_cuda_graph:
+                loss = self._graphed_step(input_ids, attention_mask, labels)
+            else:
+                loss = self._train_step(input_ids, attention_mask, labels)
+
+            train_loss += loss.detach()
+
+        return train_loss
+
+    def _train_step(self, input_ids, attention_mask, labels, model=None):
+        """单个训练步：前向、反向与参数更新，返回损失"""
+        model = self.model if model is None else model
+
+        # CRF 需要 uint8 掩码，整步只做一次类型转换，不在调用处反复分配新张量
+        mask_u8 = attention_mask.to(torch.uint8, non_blocking=True)
+
+        # 自动管理混合精度的上下文
+        with autocast(device_type=self.device.type, dtype=self._amp_dtype):
+            logits = model(input_ids, attention_mask=attention_mask)
+            logits = logits.contiguous()  # CRF 沿标签维扫描，保证最后一维连续避免隐式拷贝
+
+            # 在训练函数中计算损失
+            log_likelihood = model.crf(logits, labels, mask=mask_u8, reduction='mean')
+            loss = -log_likelihood
+
+        if self.scaler is not None:
+            # fp16 路径：使用梯度缩放进行反向传播
             self.scaler.scale(loss).backward()
             self.scaler.step(self.optimizer)  # 使用scaler来更新模型参数
             self.scaler.update()  # 更新缩放器
-            
-            yield loss
+        else:
+            # bf16 路径：不会下溢，直接反向传播并更新参数
+            loss.backward()
+            self.optimizer.step()
+        self.optimizer.zero_grad(set_to_none=True)  # 步末直接释放梯度，免去整块梯度显存的清零写入
+
+        return loss
+
+    def _graphed_step(self, input_ids, attention_mask, labels):
+        """以 CUDA Graph 回放训练步：整段前向+反向+更新只剩一次图回放，没有逐核启动开销"""
+        if self._cuda_graph is None:
+            if self._graph_warmup < 3:
+                # 先跑几步即时模式，让 cuDNN/cuBLAS 选定算法、分配器稳定下来
+                # （捕获与预热都走未编译的 _eager_model，编译包装内部自带图机制，不能再手动捕获）
+                self._graph_warmup += 1
+                return self._train_step(input_ids, attention_mask, labels, model=self._eager_model)
+
+            # 静态输入缓冲区：此后每步只把新批次拷贝进来再回放
+            self._static_ids = input_ids.clone()
+            self._static_mask = attention_mask.clone()
+            self._static_labels = labels.clone()
+            torch.cuda.synchronize()
+            self._cuda_graph = torch.cuda.CUDAGraph()
+            with torch.cuda.graph(self._cuda_graph):
+                self._static_loss = self._train_step(
+                    self._static_ids, self._static_mask, self._static_labels, model=self._eager_model,
+                )
+        else:
+            if input_ids.shape != self._static_ids.shape:
+                # 末尾不足整批（或长度不同）的批次与静态缓冲形状不符，退回即时模式单独执行
+                return self._train_step(input_ids, attention_mask, labels, model=self._eager_model)
+            self._static_ids.copy_(input_ids, non_blocking=True)
+            self._static_mask.copy_(attention_mask, non_blocking=True)
+            self._static_labels.copy_(labels, non_blocking=True)
+
+        self._cuda_graph.replay()
+        return self._static_loss.clone()  # 静态缓冲会被下一次回放覆盖，损失需单独克隆
+
+    @staticmethod
+    def _to_cpu(obj):
+        """递归地把检查点里的张量搬回 CPU，便于后台线程安全序列化"""
+        if torch.is_tensor(obj):
+            return obj.cpu()
+        if isinstance(obj, dict):
+            return {k: Trainer._to_cpu(v) for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [Trainer._to_cpu(v) for v in obj]
+        return obj
+
+    @staticmethod
+    def _report_save_error(future):
+        """后台线程里的异常不会自动冒泡，在完成回调里显式报告，避免静默丢失检查点"""
+        e = future.exception()
+        if e is not None:
+            print(f'检查点保存失败: {e}')
+
+    def _save_checkpoint_async(self, checkpoint, path):
+        """后台保存检查点：主线程只负责把权重拷回 CPU，序列化与写盘交给工作线程"""
+        checkpoint = self._to_cpu(checkpoint)  # 先固化一份 CPU 副本，后续训练继续改权重也不受影响
+        if self._save_future is not None:
+            self._save_future.result()  # 上一份尚未写完则等待，保证落盘顺序
+        self._save_future = self._save_executor.submit(
+            torch.save, checkpoint, path, _use_new_zipfile_serialization=True,
+        )
+        self._save_future.add_done_callback(self._report_save_error)
+
+    def _preallocate(self):
+        """按最大序列长度跑一次占位的前向+反向，让缓存分配器开训前就占住峰值工作集
+
+        消除稳态训练中的 cudaMalloc/free 往返与碎片化；要求后续批次长度不超过该最大长度。
+        """
+        if self.device.type != 'cuda':
+            return
+
+        # 以数据集（首样本已填充到的）序列长度作为最大长度
+        if self.preload_to_gpu:
+            max_len = self.train_ids_gpu.size(1)
+        else:
+            max_len = self.train_dataloader.dataset[0]['input_ids'].size(-1)
+
+        input_ids = torch.zeros((self.batch_size, max_len), dtype=torch.int32, device=self.device)
+        attention_mask = torch.ones((self.batch_size, max_len), dtype=torch.long, device=self.device)
+        labels = torch.zeros((self.batch_size, max_len), dtype=torch.long, device=self.device)
+
+        # 只做前向与反向占住显存，不执行 optimizer.step
+        with autocast(device_type=self.device.type, dtype=self._amp_dtype):
+            logits = self.model(input_ids, attention_mask=attention_mask)
+            loss = -self.model.crf(logits, labels, mask=attention_mask.byte(), reduction='mean')
+        if self.scaler is not None:
+            loss = self.scaler.scale(loss)
+        loss.backward()
+        self.optimizer.zero_grad(set_to_none=True)
         
-    def dev_model():
-        """在发展集上验证模型，并更新学习率"""
+    def dev_model(self):
+        """在发展集上验证模型，返回整轮累加的损失与词元级准确率（均为 0 维 GPU 张量）"""
         # TODO: 需要根据不同模型重新定义
-        total_correct = 0
-        total_samples = 0
-        for batch_idx, batch in enumerate(tqdm(self.dev_dataloader, desc="模型验证")):
-            input_ids = batch['input_ids'].to(self.device)
-            attention_mask = batch['attention_mask'].to(self.device)
-            labels = batch['labels'].to(self.device)  # 仍需要labels来进行准确率计算
+        # 脚本化副本是独立对象，不随 self.model.eval() 联动，进入验证前手动同步模式，
+        # 否则 dropout/batchnorm 仍按训练模式运行
+        if self._scripted_model is not self.model:
+            self._scripted_model.train(self.model.training)
 
-            logits = self.model(input_ids, attention_mask=attention_mask)
-            
-            # 计算损失
-            with autocast(device_type=self.device.type):
-                logits = self.model(input_ids, attention_mask=attention_mask)
-                
-                # 在训练函数中计算损失
-                log_likelihood = self.model.crf(logits, labels, mask=attention_mask.byte(), reduction='mean')
-                loss = -log_likelihood
-
-            # 计算预测序列
-            preds = self.model.decode(logits, attention_mask)
-            
-            # 计算准确率
-            acc = accuracy_score(labels, preds)
+        dev_loss = torch.zeros((), device=self.device)
+        # 正确数与有效样本数全程以 0 维 GPU 张量累加，避免每个批次都同步回主机
+        total_correct = torch.zeros((), device=self.device)
+        total_samples = torch.zeros((), device=self.device)
+        # inference_mode 比 no_grad 更彻底：连版本计数等 autograd 簿记都省掉
+        with torch.inference_mode():
+            dataloader = self.dev_dataloader
+            if self.device.type == 'cuda' and not self.preload_to_gpu:
+                dataloader = CUDAPrefetcher(dataloader, self.device)
+            for batch_idx, batch in enumerate(tqdm(dataloader, desc="模型验证")):
+                if self.preload_to_gpu:
+                    idx = batch[0].to(self.device, non_blocking=True)
+                    input_ids = self.dev_ids_gpu[idx]
+                    attention_mask = self.dev_mask_gpu[idx]
+                    labels = self.dev_labels_gpu[idx]
+                else:
+                    input_ids = batch['input_ids'].to(self.device, non_blocking=True)
+                    attention_mask = batch['attention_mask'].to(self.device, non_blocking=True)
+                    labels = batch['labels'].to(self.device, non_blocking=True)  # 仍需要labels来进行准确率计算
 
-            # # 计算正确的预测数量，只考虑非填充部分
-            # correct = (preds == labels) * attention_mask  # 应用掩码，只有非填充部分的比较结果会被保留
-            # correct_sum = correct.sum().item()  # 求和并转换为Python标量
+                if input_ids.dtype == torch.int64:
+                    input_ids = input_ids.to(torch.int32)  # 同训练路径：窄索引减半查表带宽
 
-            # # 更新 total_correct 和 total_samples
-            # total_correct += correct_sum  # 累加正确的预测数量
-            # total_samples += attention_mask.sum().item()  # 累加有效的样本数量，即非填充部分的数量
-            
-            # acc = total_correct / total_samples
-            
-            yield loss, acc
+                mask_u8 = attention_mask.to(torch.uint8, non_blocking=True)  # 同训练路径：每批只转换一次
+
+                # 计算损失（前向只做一次，直接放在混合精度上下文里）
+                with autocast(device_type=self.device.type, dtype=self._amp_dtype):
+                    logits = self._scripted_model(input_ids, attention_mask=attention_mask)
+                    logits = logits.contiguous()  # 同训练路径：CRF 前确保标签维连续
+
+                    log_likelihood = self.model.crf(logits, labels, mask=mask_u8, reduction='mean')
+                    loss = -log_likelihood
+
+                # 计算预测序列
+                preds = self._scripted_model.decode(logits, attention_mask)
+                if not torch.is_tensor(preds):
+                    # CRF 解码返回变长的 Python 列表，填充成与 labels 同形的张量
+                    preds_tensor = torch.zeros_like(labels)
+                    for i, seq in enumerate(preds):
+                        preds_tensor[i, :len(seq)] = torch.as_tensor(seq, device=self.device)
+                    preds = preds_tensor
+
+                # 计算正确的预测数量，只考虑非填充部分；比较和归约全部留在 GPU 上
+                mask = mask_u8.bool()  # 复用已转换的掩码，uint8 到 bool 只是逐位视图级转换
+                correct = ((preds == labels) & mask).sum()  # 应用掩码，只有非填充部分的比较结果会被保留
+                valid = mask.sum()  # 有效的样本数量，即非填充部分的数量
+
+                # 更新 total_correct 和 total_samples
+                total_correct += correct
+                total_samples += valid
+
+                dev_loss += loss.detach()
+
+        # 按有效词元数加权的整轮准确率，批次大小不均时不会偏置
+        return dev_loss, total_correct / total_samples.clamp(min=1)
     
     def fit(
         self,
@@ -126,38 +429,31 @@ class Trainer:
         else:
             print('无预训练模型，从零开始训练 . . .')
             start_epoch = 0
-            
+
+        # 预占显存：开训前按峰值工作集分配一次，稳态不再有分配器抖动
+        self._preallocate()
+
         # 迭代训练
         epoch_list = []
         train_loss_list = []  # 训练集损失列表
         dev_loss_list = []  # 发展集损失列表
         dev_acc_list = []  # 发展集准确率列表
         for epoch in range(epoch_num):
-            # 该epoch的
-            train_loss = 0.0  # 训练集损失
-            
-            # 遍历训练集，训练模型参数
+            # 遍历训练集，训练模型参数（整轮损失在 train_model 内部于显存累加）
             self.model.train()  # 设置模型为训练模式
-            # 获取每个 batch 的 loss
-            for loss in train_model():
-                train_loss += loss.data.item()  # 获取损失值并求和
-                
-            # 计算发展集上的损失值
+            train_loss = self.train_model()
+
+            # 计算发展集上的损失值和准确度
             self.model.eval()  # 设置模型为评估模式
-            with torch.no_grad():  # 禁用梯度计算以提高性能
-                # 计算发展集上的损失值和准确度
-                dev_loss = 0.0  # 发展集损失
-                acc_list = []
-                for loss, acc in dev_model():
-                    dev_loss += loss.data.item()
-                    acc_list.append(acc) 
-                    
-                # 更新学习率并监测验证集上的性能
-                scheduler.step(dev_loss)
-                    
-            train_loss = train_loss / len(self.train_dataloader) * self.batch_size  # 训练集每个批次的平均损失
+            dev_loss, dev_acc = self.dev_model()
+
+            # 更新学习率并监测验证集上的性能（调度器需要标量，到此才同步一次）
+            dev_loss = dev_loss.item()
+            self.scheduler.step(dev_loss)
+
+            train_loss = train_loss.item() / len(self.train_dataloader) * self.batch_size  # 训练集每个批次的平均损失
             dev_loss = dev_loss / len(self.dev_dataloader) * self.batch_size  # 验证集每个批次的平均损失
-            dev_acc = np.mean(np.array(acc_list))
+            dev_acc = dev_acc.item()  # 整个 epoch 只同步一次
             print(f'第 {start_epoch + epoch + 1} 轮训练结束，训练集 loss 为 {train_loss}，发展集 loss 为 {dev_loss}，发展集准确率为 {dev_acc}')
             train_loss_list.append(train_loss)
             dev_loss_list.append(dev_loss)
@@ -174,7 +470,7 @@ class Trainer:
             'dev_acc': dev_acc_list,
         }
             
-        torch.save(checkpoint, self.model_path + f'checkpoint_{pretrain + epoch_num}.pth')  # 保存模型
+        self._save_checkpoint_async(checkpoint, self.model_path + f'checkpoint_{pretrain + epoch_num}.pth')  # 保存模型
         
     def predict():
         '''模型推理'''
@@ -203,30 +499,28 @@ class Trainer:
         for file_path in pth_files:
             try:
                 print(file_path)
-                checkpoint = torch.load(file_path)
-                epochs = checkpoint['epoch']
-                train_losses = checkpoint['train_loss']
-                dev_losses = checkpoint['dev_loss']
-                dev_accuracies = checkpoint['dev_acc']
-                
-                all_epochs.extend(epochs)
-                all_train_losses.extend(train_losses)
-                all_dev_losses.extend(dev_losses)
-                all_dev_accuracies.extend(dev_accuracies)
-                
-                # 确保所有列表长度一致
-                # min_len = min(len(epochs), len(train_losses), len(dev_losses), len(dev_accuracies))
-                # all_epochs.extend(epochs[:min_len])
-                # all_train_losses.extend(train_losses[:min_len])
-                # all_dev_losses.extend(dev_losses[:min_len])
-                # all_dev_accuracies.extend(dev_accuracies[:min_len])
-            
+                # 只取指标字段：weights_only + mmap 按需读取，
+                # 不会把 model_state_dict/optimizer_state_dict 的权重整个反序列化进内存
+                checkpoint = torch.load(file_path, map_location='cpu', weights_only=True, mmap=True)
+                all_epochs.append(np.asarray(checkpoint['epoch']))
+                all_train_losses.append(np.asarray(checkpoint['train_loss']))
+                all_dev_losses.append(np.asarray(checkpoint['dev_loss']))
+                all_dev_accuracies.append(np.asarray(checkpoint['dev_acc']))
+
             except Exception as e:
                 print(f"读取 {file_path} 时出错，错误信息: {e}")
 
-        # 对数据按epoch排序（处理可能的乱序情况）
-        sorted_data = sorted(zip(all_epochs, all_train_losses, all_dev_losses, all_dev_accuracies), key=lambda x: x[0])
-        epochs, train_losses, dev_losses, dev_accuracies = zip(*sorted_data)
+        # 拼成 numpy 数组后按 epoch 一次性排序（处理可能的乱序情况）
+        epochs = np.concatenate(all_epochs)
+        train_losses = np.concatenate(all_train_losses)
+        dev_losses = np.concatenate(all_dev_losses)
+        dev_accuracies = np.concatenate(all_dev_accuracies)
+
+        order = np.argsort(epochs)
+        epochs = epochs[order]
+        train_losses = train_losses[order]
+        dev_losses = dev_losses[order]
+        dev_accuracies = dev_accuracies[order]
 
         # 创建图表
         fig, ax1 = plt.subplots(figsize=(12, 7))